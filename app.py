@@ -1,80 +1,211 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 from datetime import datetime, timedelta
-from dateutil.relativedelta import relativedelta
 import plotly.express as px
+import io
 import os
+import tempfile
 
-DATA_PATH = "data/equipment.csv"
+DATA_PATH = "data/equipment"  # Parquet dataset: one base file + appended rows
+SEED_CSV_PATH = "data/equipment.csv"
+NEXT_ID_PATH = "data/.next_id"
 IMG_DIR = "data/images"
+TODAY = datetime.now().date()  # the script reruns on every interaction, so this stays current
+TEXT_COLS = ["name","model","serial","consumables","notes","photo"]
+STATUSES = ["active","archived"]
+SEARCH_COLS = ["name","model","serial","consumables","notes"]
+TASK_COLS = ["id","name","model","consumables","last_service_date","interval_days","next_service_date","days_to_next"]
+LIST_COLS = ["id","name","model","serial","consumables","last_service_date","interval_days","next_service_date","status"]
+RENAME_MAP = {
+    "id":"ID","name":"Назва","model":"Модель","serial":"Серійний №",
+    "consumables":"Витратники","last_service_date":"Останнє обслуговування",
+    "interval_days":"Інтервал (дні)","next_service_date":"Наступне обслуговування",
+    "days_to_next":"Днів залишилось","status":"Статус"
+}
+COLUMNS = [
+    "id","name","model","serial","last_service_date","interval_days",
+    "consumables","notes","photo","status"
+]
 
 st.set_page_config(page_title="Домашній ППР", page_icon="🛠️", layout="wide")
 
-@st.cache_data
-def load_data(path: str) -> pd.DataFrame:
-    if not os.path.exists(path):
-        os.makedirs(os.path.dirname(path), exist_ok=True)
-        pd.DataFrame(columns=[
-            "id","name","model","serial","last_service_date","interval_days",
-            "consumables","notes","photo","status"
-        ]).to_csv(path, index=False)
-    df = pd.read_csv(path)
+def coerce_types(df: pd.DataFrame) -> pd.DataFrame:
     # ensure types
-    if "id" not in df.columns or df["id"].isnull().all():
-        df["id"] = range(1, len(df) + 1)
-    df["interval_days"] = pd.to_numeric(df.get("interval_days", 0), errors="coerce").fillna(0).astype(int)
+    # rows without an id (e.g. a blank cell in the seed CSV) get new ids after the max
+    ids = pd.to_numeric(df["id"], errors="coerce") if "id" in df.columns else pd.Series(np.nan, index=df.index)
+    missing = ids.isna()
+    if missing.any():
+        start = int(ids.max()) + 1 if ids.notna().any() else 1
+        ids[missing] = range(start, start + int(missing.sum()))
+    df["id"] = ids.astype("int64")
+    for c in TEXT_COLS:
+        df[c] = df[c].astype("string[pyarrow]").fillna("")
+    # rebuilt via string: categoricals read from Parquet have read-only codes,
+    # which break the in-place edits in the edit tab. Hand-edited values are
+    # normalised ("Active " -> "active"); anything else falls back to "active"
+    # so the row stays visible rather than becoming NaN and lost on next save
+    status = df["status"].astype("string").str.strip().str.lower()
+    status = status.where(status.isin(STATUSES), STATUSES[0])
+    df["status"] = status.astype(pd.CategoricalDtype(STATUSES))
+    df["interval_days"] = pd.to_numeric(df.get("interval_days", 0), errors="coerce").fillna(0).astype("int64")
     # parse dates
-    df["last_service_date"] = pd.to_datetime(df.get("last_service_date"), errors="coerce")
+    df["last_service_date"] = pd.to_datetime(df.get("last_service_date"), errors="coerce").astype("datetime64[ns]")
+    return df
+
+def ensure_dataset(path: str):
+    os.makedirs(path, exist_ok=True)
+    if any(f.startswith("part-") and f.endswith(".parquet") for f in os.listdir(path)):
+        return
+    # first run (or an earlier migration died half-way): migrate the CSV seed
+    # (if any) into Parquet, renaming into place only once it's fully written
+    if os.path.exists(SEED_CSV_PATH):
+        seed = pd.read_csv(SEED_CSV_PATH)
+    else:
+        seed = pd.DataFrame(columns=COLUMNS)
+    tmp = os.path.join(path, ".part-0.parquet")
+    coerce_types(seed)[COLUMNS].to_parquet(tmp, index=False)
+    os.replace(tmp, os.path.join(path, "part-0.parquet"))
+
+def dataset_stamp(path: str) -> tuple:
+    # file names, sizes and mtimes: changes whenever the dataset is written
+    # or restored from a backup, so the disk cache can't serve a stale frame;
+    # dot-prefixed temp files aren't data and may vanish mid-scan
+    return tuple(sorted((e.name, e.stat().st_size, e.stat().st_mtime_ns) for e in os.scandir(path) if not e.name.startswith(".")))
+
+@st.cache_data(persist="disk", max_entries=4)
+def load_data(path: str, stamp: tuple) -> pd.DataFrame:
+    df = coerce_types(pd.read_parquet(path))
+    # fragments are read in path order (part-10 before part-4); part-0 comes
+    # first, so if a save died before removing fragments its copy of a row wins
+    df = df.drop_duplicates("id").sort_values("id", ignore_index=True)
+    # lowercased search text, built once per load instead of per keystroke
+    df["_search_blob"] = df[SEARCH_COLS[0]].str.cat([df[c] for c in SEARCH_COLS[1:]], sep="\x1f").str.lower()
     return df
 
 def save_data(df: pd.DataFrame, path: str):
-    df.to_csv(path, index=False)
+    # rewrite the whole dataset as a single file (also compacts appended rows);
+    # written under a dot-prefixed name, which the reader ignores, then renamed
+    tmp = os.path.join(path, ".part-0.parquet")
+    df[COLUMNS].to_parquet(tmp, index=False)
+    os.replace(tmp, os.path.join(path, "part-0.parquet"))
+    # only drop fragments whose rows are now in part-0; rows appended by
+    # another session since this frame was loaded stay in their own file
+    saved = {f"part-{i}.parquet" for i in df["id"]}
+    for f in os.listdir(path):
+        if f in saved and f != "part-0.parquet":
+            os.remove(os.path.join(path, f))
+    load_data.clear()
+
+def append_row(row: dict, path: str):
+    # new rows go to their own file, no need to rewrite existing data.
+    # Written under a dot-prefixed temp name (ignored by the reader), then
+    # hard-linked into place: the link is atomic and raises FileExistsError
+    # instead of overwriting a row that already took this id
+    new = coerce_types(pd.DataFrame([row]))[COLUMNS]
+    fd, tmp = tempfile.mkstemp(dir=path, prefix=".part-", suffix=".parquet")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            new.to_parquet(f, index=False)
+        os.link(tmp, os.path.join(path, f"part-{row['id']}.parquet"))
+    finally:
+        os.unlink(tmp)
     load_data.clear()
 
-def next_service_date(row) -> datetime:
-    if pd.isna(row["last_service_date"]) or row["interval_days"] <= 0:
-        return None
-    return row["last_service_date"] + timedelta(days=int(row["interval_days"]))
+def take_next_id(df: pd.DataFrame) -> int:
+    # persisted counter, seeded from the data (once, or if the file is unreadable)
+    # so adds don't rescan ids; ids already in the data (e.g. after restoring
+    # an older counter) are skipped with an O(1) index lookup
+    try:
+        with open(NEXT_ID_PATH) as f:
+            new_id = int(f.read())
+    except (FileNotFoundError, ValueError):
+        new_id = int(df["id"].max()) + 1 if len(df) else 1
+    while new_id in df.index:
+        new_id += 1
+    # write-then-rename so a crash never leaves a truncated counter
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(NEXT_ID_PATH))
+    with os.fdopen(fd, "w") as f:
+        f.write(str(new_id + 1))
+    os.replace(tmp, NEXT_ID_PATH)
+    return new_id
+
+# RFC 5545 TEXT escaping, done in a single str.translate pass
+_ICS_TABLE = str.maketrans({"\\": "\\\\", ",": "\\,", ";": "\\;", "\n": "\\n"})
+
+def ics_escape(text: str) -> str:
+    return text.translate(_ICS_TABLE)
+
+MAX_INTERVAL_DAYS = 36_500
+NS_PER_DAY = 86_400_000_000_000
+NAT_NS = np.iinfo(np.int64).min
+
+def next_service_date(df: pd.DataFrame) -> pd.Series:
+    # plain int64 arithmetic over the datetime64[ns] buffer (NaT is int64 min)
+    last_ns = df["last_service_date"].to_numpy("datetime64[ns]").view("i8")
+    ivl = df["interval_days"].to_numpy("int64")
+    # intervals that would run past the datetime64[ns] range (year 2262) get NaT
+    # instead of wrapping around; clip first so the int64 add can't overflow
+    # (pre-1970 dates are negative: bound from 0 so the subtraction can't wrap)
+    max_days = (np.iinfo(np.int64).max - np.maximum(last_ns, 0)) // NS_PER_DAY
+    nsd = last_ns + np.clip(ivl, 0, max_days) * NS_PER_DAY
+    nsd[(ivl <= 0) | (ivl > max_days) | (last_ns == NAT_NS)] = NAT_NS
+    return pd.Series(nsd.view("datetime64[ns]"), index=df.index)
+
+def days_to_next(nsd: pd.Series, today) -> pd.Series:
+    # floor division by a day == (normalized date - today).days
+    days = (nsd.to_numpy("datetime64[ns]").view("i8") - pd.Timestamp(today).value) // NS_PER_DAY
+    return pd.Series(days, index=nsd.index).where(nsd.notna())
+
+@st.cache_data(ttl=3600, max_entries=32, hash_funcs={pd.DataFrame: lambda d: pd.util.hash_pandas_object(d, index=False).sum()})
+def compute_views(df: pd.DataFrame, status_filter: tuple, search: str, days_range: int, today) -> tuple:
+    filtered = df[df["status"].isin(status_filter)]
+    if search:
+        s = search.lower()
+        filtered = filtered[filtered["_search_blob"].str.contains(s, regex=False, na=False)]
+
+    # Upcoming tasks
+    horizon = today + timedelta(days=days_range)
+    # compare against Timestamps so pandas stays on the datetime64 buffer (NaT compares False)
+    nsd = filtered["next_service_date"]
+    start = pd.Timestamp(today)
+    end = pd.Timestamp(horizon) + pd.Timedelta(days=1)
+    upcoming = filtered.loc[(nsd >= start) & (nsd < end), TASK_COLS]
+    overdue = filtered.loc[nsd < start, TASK_COLS]
+
+    # Tasks per month for the chart
+    month = nsd.dropna().to_numpy("datetime64[M]")
+    months, tasks = np.unique(month, return_counts=True)
+    monthly = pd.DataFrame({"month": months.astype("datetime64[ns]"), "tasks": tasks})
+
+    # display-ready tables, sorted and renamed once here rather than per rerun
+    upcoming_view = upcoming.sort_values("next_service_date").rename(columns=RENAME_MAP)
+    overdue_view = overdue.sort_values("next_service_date").rename(columns={**RENAME_MAP, "days_to_next": "Днів прострочки"})
+    list_view = filtered.sort_values("name")[LIST_COLS].rename(columns=RENAME_MAP)
+    return filtered, upcoming_view, overdue_view, list_view, monthly
 
-def days_to_next(d):
-    if d is None:
-        return None
-    return (d.date() - datetime.today().date()).days
+@st.cache_resource(max_entries=16)
+def monthly_chart(_monthly: pd.DataFrame, key: bytes):
+    # `key` is the raw bytes of `_monthly`, so equal data reuses the figure
+    return px.bar(_monthly, x="month", y="tasks", title="Кількість робіт за місяцями (на горизонті фільтра)")
 
-df = load_data(DATA_PATH)
+# index by id (keeping the column for display) so edit-tab lookups are hash-based
+ensure_dataset(DATA_PATH)
+df = load_data(DATA_PATH, dataset_stamp(DATA_PATH)).set_index("id", drop=False)
 
 # Compute next service
-df["next_service_date"] = df.apply(next_service_date, axis=1)
-df["days_to_next"] = df["next_service_date"].apply(days_to_next)
+df["next_service_date"] = next_service_date(df)
+df["days_to_next"] = days_to_next(df["next_service_date"], TODAY)
 
 st.title("🛠️ Домашній ППР — облік обладнання, витратників і нагадування")
 
 # Sidebar filters
 st.sidebar.header("Фільтри")
-status_filter = st.sidebar.multiselect("Статус", ["active","archived"], default=["active"])
+status_filter = st.sidebar.multiselect("Статус", STATUSES, default=["active"])
 days_range = st.sidebar.slider("Показати задачі на N днів вперед", 0, 365, 60)
 search = st.sidebar.text_input("Пошук", placeholder="Назва / модель / серійний номер")
 
-filtered = df[df["status"].isin(status_filter)].copy()
-if search:
-    s = search.lower()
-    filtered = filtered[
-        filtered["name"].str.lower().str.contains(s, na=False) |
-        filtered["model"].str.lower().str.contains(s, na=False) |
-        filtered["serial"].str.lower().str.contains(s, na=False) |
-        filtered["consumables"].str.lower().str.contains(s, na=False) |
-        filtered["notes"].str.lower().str.contains(s, na=False)
-    ]
-
-# Upcoming tasks
-today = datetime.today().date()
-horizon = today + timedelta(days=days_range)
-upcoming = filtered.copy()
-upcoming = upcoming[~upcoming["next_service_date"].isna()]
-upcoming = upcoming[(upcoming["next_service_date"].dt.date >= today) & (upcoming["next_service_date"].dt.date <= horizon)]
-overdue = filtered.copy()
-overdue = overdue[~overdue["next_service_date"].isna()]
-overdue = overdue[overdue["next_service_date"].dt.date < today]
+filtered, upcoming, overdue, equipment, monthly = compute_views(df, tuple(status_filter), search, days_range, TODAY)
 
 col1, col2, col3 = st.columns(3)
 col1.metric("Активних позицій", int((df["status"]=="active").sum()))
@@ -82,34 +213,14 @@ col2.metric("Наближається робіт", len(upcoming))
 col3.metric("Прострочених", len(overdue))
 
 with st.expander("📅 Найближчі роботи", expanded=True):
-    st.dataframe(
-        upcoming.sort_values("next_service_date")[["id","name","model","consumables","last_service_date","interval_days","next_service_date","days_to_next"]]
-        .rename(columns={
-            "name":"Назва","model":"Модель","consumables":"Витратники",
-            "last_service_date":"Останнє обслуговування","interval_days":"Інтервал (дні)",
-            "next_service_date":"Наступне обслуговування","days_to_next":"Днів залишилось"
-        }),
-        use_container_width=True
-    )
+    st.dataframe(upcoming, use_container_width=True, hide_index=True)
 
 with st.expander("⛔ Прострочені", expanded=False):
-    st.dataframe(
-        overdue.sort_values("next_service_date")[["id","name","model","consumables","last_service_date","interval_days","next_service_date","days_to_next"]]
-        .rename(columns={
-            "name":"Назва","model":"Модель","consumables":"Витратники",
-            "last_service_date":"Останнє обслуговування","interval_days":"Інтервал (дні)",
-            "next_service_date":"Наступне обслуговування","days_to_next":"Днів прострочки"
-        }),
-        use_container_width=True
-    )
+    st.dataframe(overdue, use_container_width=True, hide_index=True)
 
 # Chart
-chart_df = filtered.copy()
-chart_df = chart_df.dropna(subset=["next_service_date"])
-if not chart_df.empty:
-    chart_df["month"] = chart_df["next_service_date"].dt.to_period("M").dt.to_timestamp()
-    monthly = chart_df.groupby("month").size().reset_index(name="tasks")
-    fig = px.bar(monthly, x="month", y="tasks", title="Кількість робіт за місяцями (на горизонті фільтра)")
+if not monthly.empty:
+    fig = monthly_chart(monthly, monthly.to_records().tobytes())
     st.plotly_chart(fig, use_container_width=True)
 
 st.markdown("---")
@@ -119,16 +230,9 @@ tab_list, tab_add, tab_edit, tab_export = st.tabs(["📋 Список облад
 
 with tab_list:
     st.subheader("Обладнання")
-    st.dataframe(
-        filtered.sort_values("name")[["id","name","model","serial","consumables","last_service_date","interval_days","next_service_date","status"]]
-        .rename(columns={
-            "id":"ID","name":"Назва","model":"Модель","serial":"Серійний №",
-            "consumables":"Витратники","last_service_date":"Останнє обслуговування",
-            "interval_days":"Інтервал (дні)","next_service_date":"Наступне обслуговування",
-            "status":"Статус"
-        }),
-        use_container_width=True
-    )
+    st.dataframe(equipment, use_container_width=True, hide_index=True)
+    # callable: the CSV is only built when the button is clicked, not on every rerun
+    st.download_button("Завантажити .csv", data=lambda frame=df: frame[COLUMNS].to_csv(index=False), file_name="equipment.csv", mime="text/csv")
 
 with tab_add:
     st.subheader("Додати обладнання")
@@ -136,38 +240,39 @@ with tab_add:
         name = st.text_input("Назва *")
         model = st.text_input("Модель")
         serial = st.text_input("Серійний №")
-        last_service = st.date_input("Дата останнього обслуговування", value=datetime.today())
-        interval_days = st.number_input("Інтервал (дні) *", min_value=0, value=180, step=1)
+        last_service = st.date_input("Дата останнього обслуговування", value=TODAY)
+        interval_days = st.number_input("Інтервал (дні) *", min_value=0, max_value=MAX_INTERVAL_DAYS, value=180, step=1)
         consumables = st.text_area("Витратники (через ;)", placeholder="фільтр; масло; прокладка")
         notes = st.text_area("Нотатки")
         photo = st.file_uploader("Фото (опційно)", type=["png","jpg","jpeg"], accept_multiple_files=False)
-        status = st.selectbox("Статус", ["active","archived"], index=0)
+        status = st.selectbox("Статус", STATUSES, index=0)
         submitted = st.form_submit_button("Додати")
         if submitted:
-            new_id = (df["id"].max() + 1) if len(df) else 1
-            photo_path = ""
+            while True:
+                new_id = take_next_id(df)
+                photo_path = os.path.join(IMG_DIR, f"{new_id}_{photo.name}") if photo is not None else ""
+                new_row = {
+                    "id": new_id,
+                    "name": name.strip(),
+                    "model": model.strip(),
+                    "serial": serial.strip(),
+                    "last_service_date": pd.to_datetime(last_service),
+                    "interval_days": int(interval_days),
+                    "consumables": consumables.strip(),
+                    "notes": notes.strip(),
+                    "photo": photo_path,
+                    "status": status
+                }
+                try:
+                    append_row(new_row, DATA_PATH)
+                    break
+                except FileExistsError:
+                    # another session added a row with this id first; take the next one
+                    continue
             if photo is not None:
                 os.makedirs(IMG_DIR, exist_ok=True)
-                photo_path = os.path.join(IMG_DIR, f"{new_id}_{photo.name}")
                 with open(photo_path, "wb") as out:
                     out.write(photo.getbuffer())
-            new_row = {
-                "id": int(new_id),
-                "name": name.strip(),
-                "model": model.strip(),
-                "serial": serial.strip(),
-                "last_service_date": pd.to_datetime(last_service),
-                "interval_days": int(interval_days),
-                "consumables": consumables.strip(),
-                "notes": notes.strip(),
-                "photo": photo_path,
-                "status": status
-            }
-            df_new = pd.concat([df, pd.DataFrame([new_row])], ignore_index=True)
-            # save with ISO date
-            df_to_save = df_new.copy()
-            df_to_save["last_service_date"] = df_to_save["last_service_date"].dt.strftime("%Y-%m-%d")
-            save_data(df_to_save, DATA_PATH)
             st.success("Додано! Оновіть сторінку, щоб побачити запис у списку.")
 
 with tab_edit:
@@ -175,22 +280,18 @@ with tab_edit:
     ids = filtered["id"].tolist()
     if ids:
         selected_id = st.selectbox("Оберіть ID обладнання", ids)
-        row = df[df["id"]==selected_id].iloc[0]
+        row = df.loc[selected_id]
         st.write(f"**{row['name']}** — наступне обслуговування: {row['next_service_date'].date() if pd.notna(row['next_service_date']) else '—'}")
         c1, c2 = st.columns(2)
         with c1:
             if st.button("✅ Позначити обслуговування виконаним (оновити дату на сьогодні)"):
-                df.loc[df["id"]==selected_id, "last_service_date"] = pd.to_datetime(datetime.today().date())
-                df_to_save = df.copy()
-                df_to_save["last_service_date"] = df_to_save["last_service_date"].dt.strftime("%Y-%m-%d")
-                save_data(df_to_save, DATA_PATH)
+                df.at[selected_id, "last_service_date"] = pd.Timestamp(TODAY)
+                save_data(df, DATA_PATH)
                 st.success("Оновлено дату останнього обслуговування.")
         with c2:
             if st.button("🗃️ Архівувати / Розархівувати"):
-                df.loc[df["id"]==selected_id, "status"] = "archived" if row["status"]=="active" else "active"
-                df_to_save = df.copy()
-                df_to_save["last_service_date"] = df_to_save["last_service_date"].dt.strftime("%Y-%m-%d")
-                save_data(df_to_save, DATA_PATH)
+                df.at[selected_id, "status"] = "archived" if row["status"]=="active" else "active"
+                save_data(df, DATA_PATH)
                 st.success("Статус змінено.")
 
         st.markdown("---")
@@ -198,19 +299,17 @@ with tab_edit:
             name_e = st.text_input("Назва", value=row["name"])
             model_e = st.text_input("Модель", value=row["model"])
             serial_e = st.text_input("Серійний №", value=row["serial"])
-            last_service_e = st.date_input("Дата останнього обслуговування", value=row["last_service_date"] if pd.notna(row["last_service_date"]) else datetime.today())
-            interval_days_e = st.number_input("Інтервал (дні)", min_value=0, value=int(row["interval_days"]))
+            last_service_e = st.date_input("Дата останнього обслуговування", value=row["last_service_date"] if pd.notna(row["last_service_date"]) else TODAY)
+            interval_days_e = st.number_input("Інтервал (дні)", min_value=0, max_value=MAX_INTERVAL_DAYS, value=min(int(row["interval_days"]), MAX_INTERVAL_DAYS))
             consumables_e = st.text_area("Витратники (через ;)", value=row["consumables"] or "")
             notes_e = st.text_area("Нотатки", value=row["notes"] or "")
-            status_e = st.selectbox("Статус", ["active","archived"], index=0 if row["status"]=="active" else 1)
+            status_e = st.selectbox("Статус", STATUSES, index=0 if row["status"]=="active" else 1)
             submitted_e = st.form_submit_button("Зберегти зміни")
             if submitted_e:
-                df.loc[df["id"]==selected_id, ["name","model","serial","last_service_date","interval_days","consumables","notes","status"]] = [
+                df.loc[selected_id, ["name","model","serial","last_service_date","interval_days","consumables","notes","status"]] = [
                     name_e, model_e, serial_e, pd.to_datetime(last_service_e), int(interval_days_e), consumables_e, notes_e, status_e
                 ]
-                df_to_save = df.copy()
-                df_to_save["last_service_date"] = df_to_save["last_service_date"].dt.strftime("%Y-%m-%d")
-                save_data(df_to_save, DATA_PATH)
+                save_data(df, DATA_PATH)
                 st.success("Зміни збережено.")
 
     else:
@@ -219,37 +318,32 @@ with tab_edit:
 with tab_export:
     st.subheader("Експорт найближчих робіт у .ics")
     horizon_days = st.number_input("Горизонт (днів)", min_value=1, value=60, step=1)
-    upc = df.copy()
-    upc["next_service_date"] = upc.apply(lambda r: r["last_service_date"] + pd.Timedelta(days=int(r["interval_days"])) if pd.notna(r["last_service_date"]) and int(r["interval_days"])>0 else pd.NaT, axis=1)
-    upc = upc.dropna(subset=["next_service_date"])
-    end_date = datetime.today().date() + timedelta(days=int(horizon_days))
-    upc = upc[(upc["next_service_date"].dt.date >= today) & (upc["next_service_date"].dt.date <= end_date)]
+    # reuse the next_service_date computed at the top (NaT compares False)
+    end_date = TODAY + timedelta(days=int(horizon_days))
+    next_dates = df["next_service_date"]
+    upc = df[(next_dates >= pd.Timestamp(TODAY)) & (next_dates < pd.Timestamp(end_date) + pd.Timedelta(days=1))]
     if upc.empty:
         st.info("Немає подій для експорту в заданому горизонті.")
     else:
         # Build ICS content
-        def ics_escape(text: str) -> str:
-            return text.replace(",", "\,").replace(";", "\;")
-        lines = ["BEGIN:VCALENDAR","VERSION:2.0","PRODID:-//Home PPR//UA//EN"]
-        for _, r in upc.iterrows():
-            dt = r["next_service_date"]
-            dtstamp = datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
-            dtstart = dt.strftime("%Y%m%d")
-            summary = f"PPR: {r['name']}"
-            description = f"Модель: {r['model']}\nВитратники: {r['consumables']}\nНотатки: {r['notes']}"
-            uid = f"{r['id']}@home-ppr.local"
-            lines += [
-                "BEGIN:VEVENT",
-                f"UID:{uid}",
-                f"DTSTAMP:{dtstamp}",
-                f"DTSTART;VALUE=DATE:{dtstart}",
-                f"SUMMARY:{ics_escape(summary)}",
-                f"DESCRIPTION:{ics_escape(description)}",
-                "END:VEVENT"
-            ]
-        lines.append("END:VCALENDAR")
-        ics_content = "\n".join(lines)
-        st.download_button("Завантажити .ics", data=ics_content, file_name="home_ppr_reminders.ics", mime="text/calendar")
+        dtstamp = datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
+        # RFC 5545 requires CRLF line endings
+        buf = io.BytesIO()
+        buf.write(b"BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:-//Home PPR//UA//EN\r\n")
+        for ev_id, ev_name, ev_model, ev_consumables, ev_notes, ev_date in upc[["id","name","model","consumables","notes","next_service_date"]].itertuples(index=False, name=None):
+            summary = f"PPR: {ev_name}"
+            description = f"Модель: {ev_model}\nВитратники: {ev_consumables}\nНотатки: {ev_notes}"
+            buf.write((
+                "BEGIN:VEVENT\r\n"
+                f"UID:{ev_id}@home-ppr.local\r\n"
+                f"DTSTAMP:{dtstamp}\r\n"
+                f"DTSTART;VALUE=DATE:{ev_date:%Y%m%d}\r\n"
+                f"SUMMARY:{ics_escape(summary)}\r\n"
+                f"DESCRIPTION:{ics_escape(description)}\r\n"
+                "END:VEVENT\r\n"
+            ).encode())
+        buf.write(b"END:VCALENDAR\r\n")
+        st.download_button("Завантажити .ics", data=buf.getvalue(), file_name="home_ppr_reminders.ics", mime="text/calendar")
         st.caption("Імпортуйте файл у Google Calendar / Apple Calendar / Outlook.")
 
 st.markdown("---")